@@ -0,0 +1,224 @@
+"""Client for the Domain-Offensive Let's Encrypt API."""
+import collections
+import logging
+import re
+import socket
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from certbot import errors
+
+logger = logging.getLogger(__name__)
+
+API_URL = 'https://www.do.de/api/letsencrypt'
+API_TIMEOUT = (5, 15)  # (connect, read) in seconds
+API_RETRIES = 3
+API_MAX_RETRY_AFTER = 10  # seconds
+RECENT_RECORDS_MAX = 64
+RECENT_RECORDS_TTL = 300  # seconds
+
+# The API only accepts the token as a query parameter, so it ends up in the request URLs that
+# urllib3 logs (e.g. on every retry) and in the messages of the exceptions requests raises.
+_TOKEN_PATTERN = re.compile(r'token=[^&\s]+')
+_TOKEN_LOGGERS = ('urllib3.connectionpool', 'urllib3.util.retry', __name__)
+
+
+class RecordRefusedError(errors.PluginError):
+    """The Domain-Offensive API definitively refused a request, so it had no effect."""
+
+
+class _TokenRedactingFilter(logging.Filter):
+    """
+    Logging filter that masks the API token in log messages and formatted tracebacks.
+    """
+
+    def filter(self, record):
+        record.msg = _redact_token(record.getMessage())
+        record.args = ()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _redact_token(logging.Formatter().formatException(record.exc_info))
+        return True
+
+
+_TOKEN_FILTER = _TokenRedactingFilter()
+
+
+class DomainOffensiveClient(object):
+    """
+    Encapsulates all communication with the Domain-Offensive API.
+    """
+
+    def __init__(self, api_token, max_connections=1):
+        self.api_token = api_token
+        self._base_params = (('token', api_token),)
+
+        for name in _TOKEN_LOGGERS:
+            # addFilter() ignores filters that are already installed.
+            logging.getLogger(name).addFilter(_TOKEN_FILTER)
+
+        # (record_name, record_content) -> time of addition, for records added by this client and
+        # not deleted since, so that repeated identical additions can be skipped.
+        self._recent = collections.OrderedDict()
+        self._recent_lock = threading.Lock()
+
+        # Reuse one keep-alive connection for all API calls, so that consecutive add and delete
+        # requests only pay for a single TLS handshake. Connection errors and transient server
+        # errors are retried with a short backoff before they are reported.
+        retries = _CappedRetry(total=API_RETRIES, backoff_factor=0.3,
+                               status_forcelist=(429, 500, 502, 503, 504),
+                               respect_retry_after_header=True)
+        self.session = requests.Session()
+        self.session.mount('https://', _KeepAliveAdapter(pool_connections=2,
+                                                         pool_maxsize=max_connections,
+                                                         max_retries=retries))
+
+    def add_txt_record(self, domain, record_name, record_content):
+        """
+        Add a TXT record using the supplied information.
+
+        :param str domain: The domain to use to look up the managed zone.
+        :param str record_name: The record name (typically beginning with '_acme-challenge.').
+        :param str record_content: The record content (typically the challenge validation).
+        :param int record_ttl: The record TTL (number of seconds that the record may be cached).
+        :raises RecordRefusedError: if the API refused to add the record
+        :raises certbot.errors.PluginError: if an error occurs communicating with the API
+        """
+
+        key = (record_name, record_content)
+        if self._added_recently(key):
+            logger.debug('TXT record %s was already added recently, skipping', record_name)
+            return
+
+        params = self._base_params + (('domain', record_name), ('value', record_content))
+
+        try:
+            r = self.session.get(API_URL, params=params, timeout=API_TIMEOUT)
+            r.raise_for_status()
+
+            success = _is_successful(r)
+            if success is False:
+                logger.error('Encountered error adding TXT record: not successful')
+                raise RecordRefusedError('Error adding TXT record: not successful')
+            if success is None:
+                logger.error('Encountered error adding TXT record: unexpected response')
+                raise errors.PluginError('Error adding TXT record: unexpected response')
+        except requests.exceptions.RequestException as e:
+            message = _redact_token(str(e))
+            logger.error('Encountered error adding TXT record: %s', message)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Traceback:', exc_info=True)
+            if e.response is not None and 400 <= e.response.status_code < 500:
+                raise RecordRefusedError('Error adding TXT record: {0}'.format(message))
+            # Timeouts, connection errors and exhausted retries leave it open whether the record
+            # was created.
+            raise errors.PluginError('Error adding TXT record: {0}'.format(message))
+
+        with self._recent_lock:
+            self._recent.pop(key, None)
+            self._recent[key] = time.time()
+            while len(self._recent) > RECENT_RECORDS_MAX:
+                self._recent.popitem(last=False)
+
+    def del_txt_record(self, domain, record_name, record_content):
+        """
+        Delete a TXT record using the supplied information.
+
+        Note that both the record's name and content are used to ensure that similar records
+        created concurrently (e.g., due to concurrent invocations of this plugin) are not deleted.
+
+        Failures are logged, but not raised.
+
+        :param str domain: The domain to use to look up the managed zone.
+        :param str record_name: The record name (typically beginning with '_acme-challenge.').
+        :param str record_content: The record content (typically the challenge validation).
+        """
+
+        # The API deletes all TXT records of the given name, regardless of their content. Forget
+        # them even if the request fails, as they may have been deleted nonetheless.
+        with self._recent_lock:
+            for key in [key for key in self._recent if key[0] == record_name]:
+                del self._recent[key]
+
+        params = self._base_params + (('domain', record_name), ('action', 'delete'))
+
+        try:
+            r = self.session.get(API_URL, params=params, timeout=API_TIMEOUT)
+            r.raise_for_status()
+
+            if not _is_successful(r):
+                logger.error('Encountered error deleting TXT record: not successful')
+        except requests.exceptions.RequestException as e:
+            logger.error('Encountered error deleting TXT record: %s', _redact_token(str(e)))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Traceback:', exc_info=True)
+
+    def _added_recently(self, key):
+        """Whether ``(record_name, record_content)`` was added within the last few minutes."""
+        with self._recent_lock:
+            added = self._recent.get(key)
+            return added is not None and time.time() - added < RECENT_RECORDS_TTL
+
+
+class _CappedRetry(Retry):
+    """
+    Retry that honours Retry-After headers, but waits at most API_MAX_RETRY_AFTER seconds, so that
+    a rate-limited API cannot stall Certbot (and every pooled worker) for an arbitrary time.
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super(_CappedRetry, self).get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, API_MAX_RETRY_AFTER)
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections enable TCP keep-alive probes, in addition to the TCP_NODELAY
+    that urllib3 sets by default, so that idle pooled connections to the API are not silently
+    dropped by middleboxes between perform and cleanup.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        super(_KeepAliveAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+def _is_successful(response):
+    """
+    Check whether a Domain-Offensive API response reports success.
+
+    :param requests.Response response: The API response.
+    :returns: ``True`` if the body is a JSON object whose ``success`` member is ``true``,
+        ``False`` for any other JSON body, and ``None`` if the body is not JSON at all.
+    :rtype: bool or None
+    """
+    try:
+        result = orjson.loads(response.content) if orjson else response.json()
+    except ValueError:
+        # e.g. an HTML error page served by a proxy; neither orjson's nor older requests'
+        # decoding errors are a RequestException.
+        return None
+    return isinstance(result, dict) and result.get('success') is True
+
+
+def _redact_token(text):
+    """
+    Mask the API token in a URL or message containing one.
+
+    :param str text: The text to redact.
+    :returns: ``text`` with the value of every ``token=`` query parameter replaced.
+    :rtype: str
+    """
+    return _TOKEN_PATTERN.sub('token=***', text)
@@ -1,21 +1,18 @@
 """DNS Authenticator for Domain-Offensive."""
 import logging
+import threading
+import time
 
-import requests
-import zope.interface
-
-from certbot import errors
 from certbot import interfaces
+from certbot.display import util as display_util
 from certbot.plugins import dns_common
 
 logger = logging.getLogger(__name__)
 
 ACCOUNT_URL = 'https://www.do.de/account/letsencrypt/'
-API_URL = 'https://www.do.de/api/letsencrypt'
+API_MAX_CONCURRENCY = 8
 
 
-@zope.interface.implementer(interfaces.IAuthenticator)
-@zope.interface.provider(interfaces.IPluginFactory)
 class Authenticator(dns_common.DNSAuthenticator):
     """DNS Authenticator for Domain-Offensive
 
@@ -28,6 +25,9 @@ class Authenticator(dns_common.DNSAuthenticator):
     def __init__(self, *args, **kwargs):
         super(Authenticator, self).__init__(*args, **kwargs)
         self.credentials = None
+        self._client = None
+        self._added = set()
+        self._added_lock = threading.Lock()
 
     @classmethod
     def add_parser_arguments(cls, add):  # pylint: disable=arguments-differ
@@ -39,6 +39,10 @@ class Authenticator(dns_common.DNSAuthenticator):
                'the Domain-Offensive API.'
 
     def _setup_credentials(self):
+        if self.credentials is not None:
+            # Already loaded by an earlier perform(); the API client holding the token is cached.
+            return
+
         self.credentials = self._configure_credentials(
             'credentials',
             'Domain-Offensive credentials INI file',
@@ -47,76 +51,118 @@ class Authenticator(dns_common.DNSAuthenticator):
             }
         )
 
-    def _perform(self, domain, validation_name, validation):
-        self._get_do_client().add_txt_record(domain, validation_name, validation)
+    def perform(self, achalls):  # pylint: disable=missing-docstring
+        self._setup_credentials()
 
-    def _cleanup(self, domain, validation_name, validation):
-        self._get_do_client().del_txt_record(domain, validation_name, validation)
+        self._attempt_cleanup = True
 
-    def _get_do_client(self):
-        return _DomainOffensiveClient(self.credentials.conf('api-token'))
+        self._run_concurrently(self._perform, achalls)
 
+        # DNS updates take time to propagate and checking to see if the update has occurred is not
+        # reliable (the machine this code is running on might be able to see an update before
+        # the ACME server). So: we sleep for a short amount of time we believe to be long enough.
+        message = 'Waiting %d seconds for DNS changes to propagate' % self.conf('propagation-seconds')
+        if hasattr(display_util, 'notify'):
+            display_util.notify(message)
+        else:
+            logger.info(message)
+        time.sleep(self.conf('propagation-seconds'))
 
-class _DomainOffensiveClient(object):
-    """
-    Encapsulates all communication with the Domain-Offensive API.
-    """
+        return [achall.response(achall.account_key) for achall in achalls]
 
-    def __init__(self, api_token):
-        self.api_token = api_token
+    def cleanup(self, achalls):  # pylint: disable=missing-docstring
+        if self._attempt_cleanup:
+            self._run_concurrently(self._cleanup, achalls)
 
-    def add_txt_record(self, domain, record_name, record_content):
+    def _run_concurrently(self, func, achalls):
         """
-        Add a TXT record using the supplied information.
+        Call ``func(domain, validation_name, validation)`` for every challenge, using a thread pool
+        so that the API round-trips overlap instead of adding up.
 
-        :param str domain: The domain to use to look up the managed zone.
-        :param str record_name: The record name (typically beginning with '_acme-challenge.').
-        :param str record_content: The record content (typically the challenge validation).
-        :param int record_ttl: The record TTL (number of seconds that the record may be cached).
-        :raises certbot.errors.PluginError: if an error occurs communicating with the API
+        :raises Exception: the first error raised by ``func``, after all calls have finished.
         """
+        if not achalls:
+            return
 
-        params = {'token': self.api_token,
-                'domain': record_name,
-                'value': record_content}
+        calls = []
+        for achall in achalls:
+            domain = _get_domain(achall)
+            calls.append((domain,
+                          achall.validation_domain_name(domain),
+                          achall.validation(achall.account_key)))
 
-        try:
-            r = requests.get(API_URL, params=params)
-            r.raise_for_status()
-
-            result = r.json()
-            if 'success' not in result or result['success'] != True:
-                logger.error('Encountered error adding TXT record: not successful')
-                raise errors.PluginError('Error adding TXT record: not successful')
-        except requests.exceptions.RequestException as e:
-            logger.error('Encountered error adding TXT record: %s', e, exc_info=True)
-            raise errors.PluginError('Error adding TXT record: {0}'.format(e))
-
-    def del_txt_record(self, domain, record_name, record_content):
-        """
-        Delete a TXT record using the supplied information.
+        if len(calls) == 1:
+            func(*calls[0])
+            return
 
-        Note that both the record's name and content are used to ensure that similar records
-        created concurrently (e.g., due to concurrent invocations of this plugin) are not deleted.
+        # Create the client up front, so that all workers share its session.
+        self._get_do_client()
 
-        Failures are logged, but not raised.
+        from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
 
-        :param str domain: The domain to use to look up the managed zone.
-        :param str record_name: The record name (typically beginning with '_acme-challenge.').
-        :param str record_content: The record content (typically the challenge validation).
-        """
+        with ThreadPoolExecutor(max_workers=min(API_MAX_CONCURRENCY, len(achalls))) as executor:
+            futures = [executor.submit(func, *args) for args in calls]
+
+        for future in futures:
+            future.result()
 
+    def _perform(self, domain, validation_name, validation):
+        client = self._get_do_client()
+        from certbot_dns_do._client import RecordRefusedError  # pylint: disable=import-outside-toplevel
 
-        params = {'token': self.api_token,
-                'domain': record_name,
-                'action': 'delete'}
+        key = (domain, validation_name, validation)
+        with self._added_lock:
+            # Tracked before the request, as a request that fails in transit may still have
+            # created the record.
+            self._added.add(key)
 
         try:
-            r = requests.get(API_URL, params=params)
-            r.raise_for_status()
-
-            result = r.json()
-            if 'success' not in result or result['success'] != True:
-                logger.error('Encountered error deleting TXT record: not successful')
-        except requests.exceptions.RequestException as e:
-            logger.error('Encountered error deleting TXT record: %s', e, exc_info=True)
+            client.add_txt_record(domain, validation_name, validation)
+        except RecordRefusedError:
+            with self._added_lock:
+                self._added.discard(key)
+            raise
+
+    def _cleanup(self, domain, validation_name, validation):
+        with self._added_lock:
+            if (domain, validation_name, validation) not in self._added:
+                # The API refused to create this record, or another challenge sharing its name
+                # already deleted it, so there is nothing to delete.
+                return
+
+            # The API deletes all TXT records of a name at once, so a single request covers all
+            # challenges sharing it (e.g. for example.com and *.example.com).
+            self._added = set(key for key in self._added if key[1] != validation_name)
+
+        self._get_do_client().del_txt_record(domain, validation_name, validation)
+
+    def _get_do_client(self):
+        if self._client is None:
+            # Imported here, as Certbot loads every installed plugin on startup, and the client's
+            # HTTP stack is only needed once this plugin actually talks to the API.
+            from certbot_dns_do._client import DomainOffensiveClient  # pylint: disable=import-outside-toplevel
+            self._client = DomainOffensiveClient(self.credentials.conf('api-token'),
+                                                 max_connections=API_MAX_CONCURRENCY)
+        return self._client
+
+
+def _get_domain(achall):
+    """
+    Get the domain of a challenge, preferring ``identifier`` on Certbot releases that deprecate
+    ``AnnotatedChallenge.domain``.
+    """
+    identifier = getattr(achall, 'identifier', None)
+    return identifier.value if identifier is not None else achall.domain
+
+
+if getattr(interfaces, 'IAuthenticator', None) is not None:
+    # Certbot < 2.0 discovers plugins through zope.interface declarations. Newer releases only
+    # need the abstract base classes, and may keep the interfaces as shims without zope.interface
+    # being installed.
+    try:
+        import zope.interface  # pylint: disable=wrong-import-position,wrong-import-order
+    except ImportError:  # pragma: no cover
+        pass
+    else:
+        zope.interface.implementer(interfaces.IAuthenticator)(Authenticator)
+        zope.interface.provider(interfaces.IPluginFactory)(Authenticator)
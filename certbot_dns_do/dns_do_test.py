@@ -0,0 +1,294 @@
+"""Tests for certbot_dns_do.dns_do."""
+# pylint: disable=protected-access
+
+import unittest
+
+try:
+    import mock
+except ImportError:  # pragma: no cover
+    from unittest import mock
+import requests
+from urllib3.response import HTTPResponse
+
+from certbot import errors
+
+from certbot_dns_do import _client
+from certbot_dns_do.dns_do import Authenticator
+
+DOMAIN = 'example.com'
+RECORD_NAME = '_acme-challenge.example.com'
+RECORD_CONTENT = 'bar'
+
+
+class DomainOffensiveClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = _client.DomainOffensiveClient('token')
+        self.response = mock.MagicMock(content=b'{"success": true}')
+        self.client.session = mock.MagicMock()
+        self.client.session.get.return_value = self.response
+
+    @mock.patch('certbot_dns_do._client.time')
+    def test_add_txt_record_skipped_within_ttl(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        mock_time.time.return_value = 1000 + _client.RECENT_RECORDS_TTL - 1
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.assertEqual(self.client.session.get.call_count, 1)
+
+    @mock.patch('certbot_dns_do._client.time')
+    def test_add_txt_record_repeated_after_ttl(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        mock_time.time.return_value = 1000 + _client.RECENT_RECORDS_TTL
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.assertEqual(self.client.session.get.call_count, 2)
+
+    @mock.patch('certbot_dns_do._client.RECENT_RECORDS_MAX', 2)
+    @mock.patch('certbot_dns_do._client.time')
+    def test_add_txt_record_evicts_oldest(self, mock_time):
+        mock_time.time.return_value = 1000
+        for content in ('a', 'b', 'c'):
+            self.client.add_txt_record(DOMAIN, RECORD_NAME, content)
+
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, 'c')
+        self.assertEqual(self.client.session.get.call_count, 3)
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, 'a')
+        self.assertEqual(self.client.session.get.call_count, 4)
+
+    @mock.patch('certbot_dns_do._client.time')
+    def test_add_txt_record_not_cached_on_failure(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.response.content = b'{"success": false}'
+        self.assertRaises(errors.PluginError,
+                          self.client.add_txt_record, DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.response.content = b'{"success": true}'
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.assertEqual(self.client.session.get.call_count, 2)
+
+    @mock.patch('certbot_dns_do._client.time')
+    def test_del_txt_record_forgets_all_records_of_name(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, 'a')
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, 'b')
+        self.client.add_txt_record(DOMAIN, '_acme-challenge.other.com', 'c')
+
+        self.client.del_txt_record(DOMAIN, RECORD_NAME, 'a')
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, 'a')
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, 'b')
+        self.client.add_txt_record(DOMAIN, '_acme-challenge.other.com', 'c')
+
+        self.assertEqual(self.client.session.get.call_count, 6)
+
+    @mock.patch('certbot_dns_do._client.time')
+    def test_failed_del_txt_record_forgets_record(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.client.session.get.side_effect = requests.exceptions.ConnectionError()
+        self.client.del_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        self.client.session.get.side_effect = None
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.assertEqual(self.client.session.get.call_count, 3)
+
+    @mock.patch('urllib3.util.retry.time.sleep')
+    @mock.patch('certbot_dns_do._client.API_URL', 'https://127.0.0.1:9/api/letsencrypt')
+    def test_token_not_logged_on_retries(self, unused_mock_sleep):
+        client = _client.DomainOffensiveClient('s3cr3t-token')
+
+        with self.assertLogs(level='DEBUG') as logs:
+            with self.assertRaises(errors.PluginError) as context:
+                client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+            client.del_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.assertTrue(any('Retrying' in record.getMessage() for record in logs.records))
+        for record in logs.records:
+            self.assertNotIn('s3cr3t-token', record.getMessage())
+            self.assertNotIn('s3cr3t-token', record.exc_text or '')
+        self.assertNotIn('s3cr3t-token', str(context.exception))
+
+    def _set_non_json_body(self):
+        self.response.content = b'<html>Maintenance</html>'
+        self.response.json.side_effect = ValueError('No JSON object could be decoded')
+
+    def test_add_txt_record(self):
+        self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.client.session.get.assert_called_once_with(
+            _client.API_URL,
+            params=(('token', 'token'), ('domain', RECORD_NAME), ('value', RECORD_CONTENT)),
+            timeout=_client.API_TIMEOUT)
+
+    def test_add_txt_record_not_successful(self):
+        self.response.content = b'{"success": false}'
+
+        self.assertRaises(_client.RecordRefusedError,
+                          self.client.add_txt_record, DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+    def test_add_txt_record_client_error(self):
+        self.response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+            response=mock.MagicMock(status_code=403))
+
+        self.assertRaises(_client.RecordRefusedError,
+                          self.client.add_txt_record, DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+    def test_add_txt_record_timeout(self):
+        self.client.session.get.side_effect = requests.exceptions.ReadTimeout()
+
+        with self.assertRaises(errors.PluginError) as context:
+            self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        self.assertNotIsInstance(context.exception, _client.RecordRefusedError)
+
+    def test_add_txt_record_non_json_body(self):
+        self._set_non_json_body()
+
+        with self.assertRaises(errors.PluginError) as context:
+            self.client.add_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        self.assertNotIsInstance(context.exception, _client.RecordRefusedError)
+
+    @mock.patch('certbot_dns_do._client.orjson', None)
+    def test_add_txt_record_non_json_body_without_orjson(self):
+        self._set_non_json_body()
+
+        self.assertRaises(errors.PluginError,
+                          self.client.add_txt_record, DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+    def test_del_txt_record_non_json_body(self):
+        self._set_non_json_body()
+
+        self.client.del_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+    @mock.patch('certbot_dns_do._client.orjson', None)
+    def test_del_txt_record_non_json_body_without_orjson(self):
+        self._set_non_json_body()
+
+        self.client.del_txt_record(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+
+class CappedRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.retry = _client._CappedRetry(total=3)
+
+    def test_retry_after_capped(self):
+        response = HTTPResponse(status=429, headers={'Retry-After': '3600'})
+
+        self.assertEqual(self.retry.get_retry_after(response), _client.API_MAX_RETRY_AFTER)
+
+    def test_retry_after_short(self):
+        response = HTTPResponse(status=429, headers={'Retry-After': '2'})
+
+        self.assertEqual(self.retry.get_retry_after(response), 2)
+
+    def test_increment_keeps_cap(self):
+        self.assertIsInstance(self.retry.increment('GET', '/'), _client._CappedRetry)
+
+
+class AuthenticatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.auth = Authenticator(mock.MagicMock(), 'dns-do')
+        self.auth._client = mock.MagicMock()
+
+    @mock.patch('certbot_dns_do.dns_do.time.sleep')
+    @mock.patch('certbot_dns_do.dns_do.display_util.notify')
+    def test_perform(self, mock_notify, mock_sleep):
+        self.auth.credentials = mock.MagicMock()
+        self.auth.conf = mock.MagicMock(return_value=30)
+        achalls = [self._achall(DOMAIN), self._achall('www.' + DOMAIN)]
+
+        responses = self.auth.perform(achalls)
+
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(self.auth._client.add_txt_record.call_count, 2)
+        self.auth._client.add_txt_record.assert_any_call(
+            'www.' + DOMAIN, '_acme-challenge.www.' + DOMAIN, RECORD_CONTENT)
+        mock_notify.assert_called_once_with('Waiting 30 seconds for DNS changes to propagate')
+        mock_sleep.assert_called_once_with(30)
+
+    def test_cleanup_deletes_shared_name_once(self):
+        self.auth.credentials = mock.MagicMock()
+        self.auth.conf = mock.MagicMock(return_value=0)
+        # A wildcard and its base domain are validated with the same record name.
+        achalls = [self._achall(DOMAIN, 'base'), self._achall(DOMAIN, 'wildcard')]
+
+        with mock.patch('certbot_dns_do.dns_do.time.sleep'), \
+                mock.patch('certbot_dns_do.dns_do.display_util.notify'):
+            self.auth.perform(achalls)
+        self.auth.cleanup(achalls)
+
+        self.auth._client.del_txt_record.assert_called_once_with(DOMAIN, RECORD_NAME, mock.ANY)
+        for validation in ('base', 'wildcard'):
+            self.auth._cleanup(DOMAIN, RECORD_NAME, validation)
+        self.assertEqual(self.auth._client.del_txt_record.call_count, 1)
+
+    def test_perform_raises_after_all_adds(self):
+        self.auth.credentials = mock.MagicMock()
+        self.auth.conf = mock.MagicMock(return_value=0)
+        achalls = [self._achall(DOMAIN), self._achall('www.' + DOMAIN)]
+
+        def add_txt_record(domain, unused_record_name, unused_record_content):
+            if domain == DOMAIN:
+                raise errors.PluginError('refused')
+        self.auth._client.add_txt_record.side_effect = add_txt_record
+
+        self.assertRaises(errors.PluginError, self.auth.perform, achalls)
+        self.auth._client.add_txt_record.assert_any_call(
+            'www.' + DOMAIN, '_acme-challenge.www.' + DOMAIN, RECORD_CONTENT)
+        self.assertEqual(self.auth._client.add_txt_record.call_count, 2)
+
+    @mock.patch('concurrent.futures.ThreadPoolExecutor')
+    def test_perform_single_challenge_without_thread_pool(self, mock_executor):
+        self.auth.credentials = mock.MagicMock()
+        self.auth.conf = mock.MagicMock(return_value=0)
+
+        with mock.patch('certbot_dns_do.dns_do.time.sleep'), \
+                mock.patch('certbot_dns_do.dns_do.display_util.notify'):
+            self.auth.perform([self._achall(DOMAIN)])
+
+        mock_executor.assert_not_called()
+        self.auth._client.add_txt_record.assert_called_once_with(
+            DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+    @staticmethod
+    def _achall(domain, validation=RECORD_CONTENT):
+        achall = mock.MagicMock()
+        achall.identifier.value = domain
+        achall.validation_domain_name.side_effect = lambda name: '_acme-challenge.' + name
+        achall.validation.return_value = validation
+        return achall
+
+    def test_cleanup_after_add(self):
+        self.auth._perform(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        self.auth._cleanup(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.auth._client.del_txt_record.assert_called_once_with(
+            DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+    def test_cleanup_skipped_after_refused_add(self):
+        self.auth._client.add_txt_record.side_effect = _client.RecordRefusedError()
+
+        self.assertRaises(errors.PluginError, self.auth._perform,
+                          DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        self.auth._cleanup(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.auth._client.del_txt_record.assert_not_called()
+
+    def test_cleanup_after_failed_add(self):
+        self.auth._client.add_txt_record.side_effect = errors.PluginError()
+
+        self.assertRaises(errors.PluginError, self.auth._perform,
+                          DOMAIN, RECORD_NAME, RECORD_CONTENT)
+        self.auth._cleanup(DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+        self.auth._client.del_txt_record.assert_called_once_with(
+            DOMAIN, RECORD_NAME, RECORD_CONTENT)
+
+
+if __name__ == '__main__':
+    unittest.main()  # pragma: no cover
@@ -9,9 +9,10 @@ version = '0.31.0'
 install_requires = [
     'acme>=0.21.1',
     'certbot>=0.21.1',
+    'futures; python_version < "3.0"',
     'requests',
     'setuptools',
-    'zope.interface',
+    'urllib3',
 ]
 
 docs_extras = [